@@ -10,202 +10,379 @@ Supports cookies via URL parameter to bypass bot detection.
 """
 
 import runpod
-import subprocess
-import json
+import hashlib
+import logging
 import os
+import re
+import shutil
 import sys
-import urllib.request
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from urllib.parse import urlsplit
+
+import urllib3
+from yt_dlp import YoutubeDL
+from yt_dlp.version import __version__ as YTDLP_VERSION
+
+# Logging (LOG_LEVEL=WARNING in production skips the per-event chatter)
+logger = logging.getLogger('handler')
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+logger.propagate = False
+_log_handler = logging.StreamHandler(sys.stdout)
+_log_handler.setFormatter(logging.Formatter('%(message)s'))
+logger.addHandler(_log_handler)
+
+# Cookies file path per cookies_url hash (downloaded at runtime)
+COOKIES_PATH_TEMPLATE = '/tmp/cookies.{}.txt'
+COOKIES_MAX_AGE = 600  # Seconds before a cookies file is downloaded again
+COOKIES_MAX_SIZE = 1024 * 1024  # Real cookies files are well under 100KB
+_cookies_locks = {}
+
+# yt-dlp options shared by every extraction (in-process, no CLI fork)
+YDL_OPTS = {
+    'quiet': True,
+    'skip_download': True,
+    'remote_components': ['ejs:github'],  # deno for n-parameter
+    'noplaylist': True,  # watch?v=...&list=... extracts the video only
+    'check_formats': False,  # no probe requests, URLs are returned as-is
+    'no_warnings': True,
+}
+
+# Resolved once per container (logged on every event)
+DENO_PATH = shutil.which('deno') or 'NOT FOUND'
+
+# Info cache for warm containers: video id -> (expires_at, info)
+# TTL must stay well below the ~6h lifetime of the signed fragment URLs
+INFO_CACHE_TTL = 3600
+INFO_CACHE_MAX_SIZE = 1024
+_info_cache = OrderedDict()
+_info_cache_lock = threading.Lock()
+
+# Pooled keep-alive HTTP client for cookies and HLS manifests
+HTTP = urllib3.PoolManager(maxsize=16, retries=urllib3.Retry(total=3, backoff_factor=0.2))
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+# Warm YoutubeDL reused across events (built lazily by get_ydl)
+_ydl = None
+_ydl_cookies_key = None
+
+# Shared pool for overlapping network-bound steps (reused across events)
+EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
+# Format scoring lookups (shared by every event)
+EXT_SCORE_VIDEO = {'webm': 2, 'mp4': 1}  # webm (VP9) > mp4 (H.264)
+EXT_SCORE_AUDIO = {'m4a': 1}
+HLS_URL_RE = re.compile(r'(?i)manifest|\.m3u8')
+
+# Fragment lists at least this long are sent as a URL template
+FRAGMENT_TEMPLATE_MIN_COUNT = 50
+DIGITS = '0123456789'
+
+# Non-comment m3u8 lines (segment URIs), surrounding whitespace excluded
+M3U8_SEGMENT_RE = re.compile(rb'(?m)^[ \t]*([^#\s][^\r\n]*?)[ \t\r]*$')
+
+YOUTUBE_ID_RE = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([\w-]{11})(?![\w-])')
+YOUTUBE_HOSTS = ('youtube.com', 'youtu.be')
+
+
+def fetch_cookies(cookies_url: str, cookies_path: str) -> str:
+    """
+    Download cookies file from URL to cookies_path.
+    Returns cookies_path or None if failed.
+    """
+    logger.info("[Cookies] Downloading from: %s...", cookies_url[:50])
 
-# Cookies file path (downloaded at runtime)
-COOKIES_PATH = '/tmp/cookies.txt'
+    tmp_path = None
+    try:
+        response = HTTP.request('GET', cookies_url, headers=HTTP_HEADERS, timeout=10, preload_content=False)
+        try:
+            if response.status != 200:
+                raise Exception(f"HTTP {response.status}")
+
+            # Stream to a temp file with a size cap, then swap it in atomically
+            # so a partial download never replaces the previous cookies
+            size = 0
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(cookies_path), delete=False) as f:
+                tmp_path = f.name
+                for chunk in response.stream(65536):
+                    size += len(chunk)
+                    if size > COOKIES_MAX_SIZE:
+                        raise ValueError(f"cookies file larger than {COOKIES_MAX_SIZE} bytes")
+                    f.write(chunk)
+        finally:
+            response.release_conn()
+
+        os.replace(tmp_path, cookies_path)
+        tmp_path = None
+
+        logger.info("[Cookies] Downloaded: %d bytes", size)
+        return cookies_path
+    except Exception as e:
+        logger.warning("[Cookies] Download error: %s", e)
+        return None
+    finally:
+        if tmp_path:
+            os.unlink(tmp_path)
 
 
 def download_cookies(cookies_url: str) -> str:
     """
-    Download cookies file from URL to /tmp/cookies.txt.
+    Download cookies file from URL to /tmp/cookies.<hash>.txt.
+    A file fetched from the same URL less than COOKIES_MAX_AGE ago is
+    reused, so warm containers skip the download on back-to-back events.
     Returns path to cookies file or None if failed.
     """
     if not cookies_url:
         return None
 
-    print(f"[Cookies] Downloading from: {cookies_url[:50]}...")
+    key = hashlib.sha1(cookies_url.encode()).hexdigest()[:16]
+    cookies_path = COOKIES_PATH_TEMPLATE.format(key)
 
-    try:
-        urllib.request.urlretrieve(cookies_url, COOKIES_PATH)
-
-        # Verify file was downloaded
-        if os.path.exists(COOKIES_PATH):
-            size = os.path.getsize(COOKIES_PATH)
-            print(f"[Cookies] Downloaded: {size} bytes")
-            return COOKIES_PATH
-        else:
-            print("[Cookies] Download failed: file not created")
-            return None
-    except Exception as e:
-        print(f"[Cookies] Download error: {e}")
-        return None
+    # One lock per URL (setdefault is atomic) so parallel events don't race
+    with _cookies_locks.setdefault(key, threading.Lock()):
+        try:
+            if time.time() - os.path.getmtime(cookies_path) < COOKIES_MAX_AGE:
+                logger.info("[Cookies] Reusing: %s", cookies_path)
+                return cookies_path
+        except OSError:
+            pass  # Not downloaded yet
+
+        return fetch_cookies(cookies_url, cookies_path)
+
+
+def get_ydl(cookies_path: str = None) -> YoutubeDL:
+    """
+    Return the YoutubeDL instance shared by warm invocations.
+    Built on first use and kept alive so extractor instances and their
+    player/signature caches survive between events; rebuilt only when the
+    cookies file changes.
+    """
+    global _ydl, _ydl_cookies_key
+
+    cookies_key = (cookies_path, os.path.getmtime(cookies_path)) if cookies_path else None
+
+    if _ydl is None or cookies_key != _ydl_cookies_key:
+        if _ydl is not None:
+            # Don't let the old jar overwrite the freshly downloaded cookies
+            _ydl.params['cookiefile'] = None
+            _ydl.close()
+
+        opts = dict(YDL_OPTS)
+        if cookies_path:
+            opts['cookiefile'] = cookies_path
+
+        _ydl = YoutubeDL(opts)
+        _ydl_cookies_key = cookies_key
+
+    return _ydl
 
 
 def get_video_info(url: str, cookies_path: str = None) -> dict:
     """
     Extract video info with all format details using yt-dlp.
-    Returns the full JSON info from yt-dlp.
+    Returns the full info dict from yt-dlp.
     """
-    cmd = [
-        'yt-dlp',
-        '--dump-json',
-        '--no-download',
-        '--remote-components', 'ejs:github',  # deno for n-parameter
-    ]
-
     # Add cookies if available
     if cookies_path and os.path.exists(cookies_path):
-        cmd.extend(['--cookies', cookies_path])
-        print(f"[yt-dlp] Using cookies: {cookies_path}")
+        logger.debug("[yt-dlp] Using cookies: %s", cookies_path)
+    else:
+        cookies_path = None
 
-    cmd.append(url)
+    logger.info("[yt-dlp] Extracting info: %s", url)
 
-    print(f"[yt-dlp] Extracting info: {url}")
-    print(f"[yt-dlp] Command: {' '.join(cmd)}")
+    return get_ydl(cookies_path).extract_info(url, download=False)
 
-    result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
 
-    if result.returncode != 0:
-        raise Exception(f"yt-dlp error: {result.stderr[-1000:]}")
+def get_video_id(url: str) -> str:
+    """
+    Extract the YouTube video id from a youtube.com/youtu.be URL.
+    Falls back to the URL itself so other links (even with a ?v=) get
+    their own key instead of a YouTube video's cache entry.
+    """
+    host = (urlsplit(url).hostname or '').lower()
+    if not any(host == h or host.endswith('.' + h) for h in YOUTUBE_HOSTS):
+        return url
+    match = YOUTUBE_ID_RE.search(url)
+    return match.group(1) if match else url
+
+
+def get_video_info_cached(url: str, cookies_url: str = None, cache_bust: bool = False) -> dict:
+    """
+    get_video_info with an in-process TTL/LRU cache keyed by video id.
+    Cookies are only downloaded on a miss (a hit doesn't need them).
+    cache_bust=True skips the lookup and refreshes the entry.
+    """
+    key = get_video_id(url)
+    now = time.monotonic()
+
+    if not cache_bust:
+        with _info_cache_lock:
+            entry = _info_cache.get(key)
+            if entry and entry[0] > now:
+                _info_cache.move_to_end(key)
+                logger.info("[Cache] Hit: %s", key)
+                return entry[1]
+
+    cookies_path = download_cookies(cookies_url) if cookies_url else None
+    info = get_video_info(url, cookies_path)
+
+    with _info_cache_lock:
+        _info_cache[key] = (now + INFO_CACHE_TTL, info)
+        _info_cache.move_to_end(key)
+        while len(_info_cache) > INFO_CACHE_MAX_SIZE:
+            _info_cache.popitem(last=False)
 
-    # Parse JSON output
-    info = json.loads(result.stdout)
     return info
 
 
-def select_best_video_format(formats: list, max_height: int = 720) -> dict:
+def annotate_video_format(f: dict) -> None:
+    """
+    Store the height-independent part of the video score on the format dict
+    (_url_score, _ext_score). Cached info dicts keep these fields, so events
+    served from the info cache skip the URL inspection entirely.
+    """
+    # Check if format has direct fragment URLs (DASH)
+    fragments = f.get('fragments') or []
+    if len(fragments) > 1:
+        has_direct_fragments = True
+    elif fragments:
+        first_url = fragments[0].get('url') or ''
+        has_direct_fragments = first_url.startswith('https://') and not HLS_URL_RE.search(first_url)
+    else:
+        has_direct_fragments = False
+
+    # Prefer formats with direct URLs (not HLS manifest)
+    url = f.get('url') or ''
+    is_hls = HLS_URL_RE.search(url) is not None
+
+    # Score: direct fragments > direct URL > HLS
+    if has_direct_fragments:
+        f['_url_score'] = 3
+    elif url and not is_hls:
+        f['_url_score'] = 2
+    else:
+        f['_url_score'] = 1
+
+    # Prefer webm (VP9) over mp4 (H.264)
+    f['_ext_score'] = EXT_SCORE_VIDEO.get(f.get('ext'), 0)
+
+
+def partition_formats(formats: list) -> tuple:
+    """
+    Split formats into (video_only, audio_only, muxed) lists in one pass.
+    Formats with neither stream (storyboards) are dropped.
+    Video formats are annotated for scoring on the way (once per info dict).
+    """
+    video_only, audio_only, muxed = [], [], []
+
+    for f in formats:
+        has_video = f.get('vcodec') != 'none'
+        has_audio = f.get('acodec') != 'none'
+        if has_video and '_url_score' not in f:
+            annotate_video_format(f)
+        if has_video and has_audio:
+            muxed.append(f)
+        elif has_video:
+            video_only.append(f)
+        elif has_audio:
+            audio_only.append(f)
+
+    return video_only, audio_only, muxed
+
+
+def score_video_formats(formats: list, max_height: int) -> list:
+    """
+    Return (score, format) pairs for formats with height ≤ max_height.
+    Formats must have gone through partition_formats (annotated).
+    Score: direct fragments > direct URL > HLS, then webm > mp4, height, tbr.
+    """
+    candidates = []
+
+    for f in formats:
+        height = f.get('height')
+        if height is None or height > max_height:
+            continue
+
+        candidates.append(((f['_url_score'], f['_ext_score'], height, f.get('tbr') or 0), f))
+
+    return candidates
+
+
+def select_best_video_format(video_formats: list, max_height: int = 720, muxed_formats: list = ()) -> dict:
     """
     Select the best video format with height ≤ max_height.
+    Takes the video-only list from partition_formats; muxed formats are only
+    scored when no video-only format qualifies.
     Prefers DASH formats (with direct fragment URLs) over HLS.
     """
-    video_formats = [
-        f for f in formats
-        if f.get('vcodec') != 'none'
-        and f.get('acodec') == 'none'  # Video-only (no muxed)
-        and f.get('height') is not None
-        and f.get('height') <= max_height
-    ]
-
-    if not video_formats:
-        # Fallback: include muxed formats
-        video_formats = [
-            f for f in formats
-            if f.get('vcodec') != 'none'
-            and f.get('height') is not None
-            and f.get('height') <= max_height
-        ]
-
-    if not video_formats:
+    for bucket in (video_formats, muxed_formats):
+        candidates = score_video_formats(bucket, max_height)
+        if candidates:
+            break
+    else:
         raise Exception(f"No video format found with height ≤ {max_height}")
 
-    # Scoring function: prefer webm (VP9) > mp4 (H.264), and DASH over HLS
-    def format_score(f):
-        height = f.get('height', 0)
-        tbr = f.get('tbr', 0) or 0
-        ext = f.get('ext', '')
-
-        # Check if format has direct fragment URLs (DASH)
-        fragments = f.get('fragments', [])
-        has_direct_fragments = len(fragments) > 1 or (
-            len(fragments) == 1 and
-            fragments[0].get('url', '').startswith('https://') and
-            'manifest' not in fragments[0].get('url', '').lower()
-        )
-
-        # Prefer formats with direct URLs (not HLS manifest)
-        url = f.get('url', '')
-        is_hls = 'manifest' in url.lower() or url.endswith('.m3u8')
-
-        # Score: direct fragments > direct URL > HLS
-        if has_direct_fragments:
-            url_score = 3
-        elif url and not is_hls:
-            url_score = 2
-        else:
-            url_score = 1
-
-        # Prefer webm (VP9) over mp4 (H.264)
-        if ext == 'webm':
-            ext_score = 2
-        elif ext == 'mp4':
-            ext_score = 1
-        else:
-            ext_score = 0
-
-        return (url_score, ext_score, height, tbr)
-
-    video_formats.sort(key=format_score, reverse=True)
-
-    selected = video_formats[0]
-    print(f"[VideoFormat] Selected: {selected.get('format_id')} - {selected.get('height')}p")
-    print(f"[VideoFormat] Has fragments: {len(selected.get('fragments', []))}")
-    print(f"[VideoFormat] URL type: {'HLS' if 'manifest' in selected.get('url', '').lower() else 'Direct'}")
+    selected = max(candidates, key=itemgetter(0))[1]
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[VideoFormat] Selected: %s - %sp", selected.get('format_id'), selected.get('height'))
+        logger.debug("[VideoFormat] Has fragments: %d", len(selected.get('fragments') or []))
+        logger.debug("[VideoFormat] URL type: %s", 'HLS' if HLS_URL_RE.search(selected.get('url') or '') else 'Direct')
 
     return selected
 
 
-def select_best_audio_format(formats: list) -> dict:
+def select_best_audio_format(audio_formats: list) -> dict:
     """
     Select the best audio-only format.
+    Takes the audio-only list from partition_formats.
     Prefers m4a/aac for compatibility.
     """
-    audio_formats = [
-        f for f in formats
-        if f.get('vcodec') == 'none'
-        and f.get('acodec') != 'none'
-    ]
-
     if not audio_formats:
         raise Exception("No audio-only format found")
 
-    # Prefer m4a, then sort by abr (audio bitrate)
+    # Prefer m4a, then highest abr (audio bitrate)
     def audio_score(f):
-        ext_score = 1 if f.get('ext') == 'm4a' else 0
+        ext_score = EXT_SCORE_AUDIO.get(f.get('ext'), 0)
         abr = f.get('abr', 0) or 0
         return (ext_score, abr)
 
-    audio_formats.sort(key=audio_score, reverse=True)
-
-    return audio_formats[0]
+    return max(audio_formats, key=audio_score)
 
 
 def fetch_hls_segments(manifest_url: str) -> list:
     """
     Fetch HLS manifest and extract segment URLs.
     """
-    print(f"[HLS] Fetching manifest: {manifest_url[:80]}...")
+    logger.debug("[HLS] Fetching manifest: %s...", manifest_url[:80])
 
     try:
-        req = urllib.request.Request(manifest_url, headers={
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-        with urllib.request.urlopen(req, timeout=30) as response:
-            content = response.read().decode('utf-8')
+        response = HTTP.request('GET', manifest_url, headers=HTTP_HEADERS, timeout=30)
+        if response.status != 200:
+            raise Exception(f"HTTP {response.status}")
 
-        # Parse m3u8 - extract segment URLs
+        # Parse m3u8 - scan raw bytes for segment URLs, comments never decoded
         segments = []
         base_url = manifest_url.rsplit('/', 1)[0] + '/'
 
-        for line in content.split('\n'):
-            line = line.strip()
-            if line and not line.startswith('#'):
-                # This is a segment URL
-                if line.startswith('http'):
-                    segments.append(line)
-                else:
-                    # Relative URL
-                    segments.append(base_url + line)
-
-        print(f"[HLS] Found {len(segments)} segments")
+        for match in M3U8_SEGMENT_RE.finditer(response.data):
+            line = match.group(1).decode('utf-8')
+            if line.startswith(('http://', 'https://')):
+                segments.append(line)
+            else:
+                # Relative URL
+                segments.append(base_url + line)
+
+        logger.debug("[HLS] Found %d segments", len(segments))
         return segments
 
     except Exception as e:
-        print(f"[HLS] Error fetching manifest: {e}")
+        logger.warning("[HLS] Error fetching manifest: %s", e)
         return []
 
 
@@ -214,32 +391,34 @@ def extract_fragment_urls(format_info: dict, fetch_hls: bool = True) -> list:
     Extract fragment URLs from a format.
     Works with HLS and DASH formats.
     If fetch_hls=True, will fetch and parse HLS manifest to get segment URLs.
+    Formats yt-dlp already split into fragments (DASH) never trigger a fetch.
     """
-    fragments = format_info.get('fragments', [])
+    fragments = format_info.get('fragments') or []
+
+    # DASH: fragments already resolved by yt-dlp, no manifest round-trip
+    if len(fragments) > 1:
+        return [url for url in (f.get('url') or f.get('path') for f in fragments) if url]
 
     if fragments:
-        # Check if it's HLS manifest or direct fragments
-        urls = []
-        for f in fragments:
-            url = f.get('url') or f.get('path')
-            if url:
-                urls.append(url)
+        url = fragments[0].get('url') or fragments[0].get('path')
+        if not url:
+            return []
 
         # If single URL is HLS manifest, fetch segment URLs
-        if len(urls) == 1 and fetch_hls:
-            url = urls[0]
-            if 'manifest' in url.lower() or '.m3u8' in url.lower():
-                hls_segments = fetch_hls_segments(url)
-                if hls_segments:
-                    return hls_segments
+        if fetch_hls and HLS_URL_RE.search(url):
+            hls_segments = fetch_hls_segments(url)
+            if hls_segments:
+                return hls_segments
 
-        return urls
+        return [url]
 
-    # Single URL (progressive format)
+    # Single URL (progressive format, or HLS media playlist)
+    # For HLS, 'url' is already the variant playlist ('manifest_url' is the
+    # master), so a single fetch is enough to list the segments.
     url = format_info.get('url')
     if url:
-        # Check if it's HLS manifest
-        if fetch_hls and ('manifest' in url.lower() or '.m3u8' in url.lower()):
+        is_hls = (format_info.get('protocol') or '').startswith('m3u8') or HLS_URL_RE.search(url)
+        if fetch_hls and is_hls:
             hls_segments = fetch_hls_segments(url)
             if hls_segments:
                 return hls_segments
@@ -248,10 +427,49 @@ def extract_fragment_urls(format_info: dict, fetch_hls: bool = True) -> list:
     return []
 
 
+def build_fragment_template(fragments: list) -> dict:
+    """
+    Describe fragment URLs as prefix + index + suffix when every URL fits
+    that pattern with consecutive indexes (YouTube '.../sq/N/...').
+    Returns None for short lists or when the pattern isn't exact, so the
+    template is always lossless.
+    """
+    if len(fragments) < FRAGMENT_TEMPLATE_MIN_COUNT:
+        return None
+
+    # Digits at the edges belong to the index, not the shared parts
+    prefix = os.path.commonprefix(fragments).rstrip(DIGITS)
+    suffix = os.path.commonprefix([url[::-1] for url in fragments])[::-1].lstrip(DIGITS)
+
+    first_index = None
+    for i, url in enumerate(fragments):
+        end = len(url) - len(suffix)
+        index = url[len(prefix):end]
+        # Rejects overlap, non-digits and zero-padded indexes alike
+        if end < len(prefix) or not index.isdigit() or str(int(index)) != index:
+            return None
+        if first_index is None:
+            first_index = int(index)
+        elif int(index) != first_index + i:
+            return None
+
+    return {
+        'prefix': prefix,
+        'suffix': suffix,
+        'count': len(fragments),
+        'first_index': first_index,
+    }
+
+
 def create_manifest(format_info: dict, fragments: list) -> dict:
     """
     Create a manifest dict with format info and fragment URLs.
+    Long fragment lists following a URL pattern are sent as a
+    fragment_template instead (fragments is then None); URL i is
+    prefix + str(first_index + i) + suffix.
     """
+    fragment_template = build_fragment_template(fragments)
+
     return {
         'format_id': format_info.get('format_id'),
         'ext': format_info.get('ext'),
@@ -265,7 +483,8 @@ def create_manifest(format_info: dict, fragments: list) -> dict:
         'abr': format_info.get('abr'),
         'filesize': format_info.get('filesize') or format_info.get('filesize_approx'),
         'fragment_count': len(fragments),
-        'fragments': fragments,
+        'fragments': fragments if fragment_template is None else None,
+        'fragment_template': fragment_template,
         # Direct URL if available (for progressive formats)
         'url': format_info.get('url') if not fragments else None,
     }
@@ -278,7 +497,9 @@ def handler(event):
     Input:
         {
             "url": "https://www.youtube.com/watch?v=...",
-            "max_video_height": 720  # optional, default 720
+            "max_video_height": 720,  # optional, default 720
+            "cookies_url": "https://...",  # optional
+            "cache_bust": false  # optional, force a fresh extraction
         }
 
     Output:
@@ -294,52 +515,47 @@ def handler(event):
         url = input_data.get('url')
         max_height = input_data.get('max_video_height', 720)
         cookies_url = input_data.get('cookies_url')  # Optional: URL to cookies file
+        cache_bust = bool(input_data.get('cache_bust', False))  # Optional: refresh cached info
 
         if not url:
             return {'error': 'Missing required parameter: url'}
 
-        print(f"[Handler] Processing URL: {url}")
-        print(f"[Handler] Max video height: {max_height}")
-        print(f"[Handler] Cookies URL: {'provided' if cookies_url else 'none'}")
+        logger.info("[Handler] Processing URL: %s", url)
+        logger.debug("[Handler] Max video height: %s", max_height)
+        logger.debug("[Handler] Cookies URL: %s", 'provided' if cookies_url else 'none')
 
-        # Download cookies if URL provided
-        cookies_path = None
-        if cookies_url:
-            cookies_path = download_cookies(cookies_url)
-
-        # Check yt-dlp version
-        version_result = subprocess.run(['yt-dlp', '--version'], capture_output=True, text=True)
-        print(f"[yt-dlp] Version: {version_result.stdout.strip()}")
+        logger.debug("[yt-dlp] Version: %s", YTDLP_VERSION)
+        logger.debug("[deno] Path: %s", DENO_PATH)
 
-        # Check deno
-        deno_result = subprocess.run(['which', 'deno'], capture_output=True, text=True)
-        print(f"[deno] Path: {deno_result.stdout.strip() or 'NOT FOUND'}")
-
-        # Extract video info
-        info = get_video_info(url, cookies_path)
+        # Extract video info (downloads cookies first on a cache miss)
+        info = get_video_info_cached(url, cookies_url, cache_bust)
 
         title = info.get('title', 'Unknown')
         duration = info.get('duration', 0)
         formats = info.get('formats', [])
 
-        print(f"[Handler] Title: {title}")
-        print(f"[Handler] Duration: {duration}s")
-        print(f"[Handler] Formats available: {len(formats)}")
+        logger.info("[Handler] Title: %s", title)
+        logger.debug("[Handler] Duration: %ss", duration)
+        logger.debug("[Handler] Formats available: %d", len(formats))
+
+        # Split formats once, then pick from the relevant buckets
+        video_only, audio_only, muxed = partition_formats(formats)
 
         # Select best video format (≤720p)
-        video_format = select_best_video_format(formats, max_height)
-        print(f"[Handler] Selected video: {video_format.get('format_id')} - {video_format.get('height')}p")
+        video_format = select_best_video_format(video_only, max_height, muxed)
+        logger.info("[Handler] Selected video: %s - %sp", video_format.get('format_id'), video_format.get('height'))
 
         # Select best audio format
-        audio_format = select_best_audio_format(formats)
-        print(f"[Handler] Selected audio: {audio_format.get('format_id')} - {audio_format.get('ext')}")
+        audio_format = select_best_audio_format(audio_only)
+        logger.info("[Handler] Selected audio: %s - %s", audio_format.get('format_id'), audio_format.get('ext'))
 
-        # Extract fragment URLs
-        video_fragments = extract_fragment_urls(video_format)
+        # Extract fragment URLs (HLS manifests fetched in parallel)
+        video_future = EXECUTOR.submit(extract_fragment_urls, video_format)
         audio_fragments = extract_fragment_urls(audio_format)
+        video_fragments = video_future.result()
 
-        print(f"[Handler] Video fragments: {len(video_fragments)}")
-        print(f"[Handler] Audio fragments: {len(audio_fragments)}")
+        logger.debug("[Handler] Video fragments: %d", len(video_fragments))
+        logger.debug("[Handler] Audio fragments: %d", len(audio_fragments))
 
         # Create manifests
         video_manifest = create_manifest(video_format, video_fragments)
@@ -354,7 +570,7 @@ def handler(event):
         }
 
     except Exception as e:
-        print(f"[Handler] Error: {e}")
+        logger.error("[Handler] Error: %s", e)
         return {'error': str(e)}
 
 
@@ -10,17 +10,28 @@ Endpoints:
 - POST /orchestrateur-gpu - GPU orchestrator (TODO)
 - GET /health - Health check
 - GET /stats - Server statistics
+- PATCH /stats - Change max concurrent extractions at runtime
 """
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Optional
-import subprocess
-import json
+from cachetools import TTLCache
+from yt_dlp import YoutubeDL
+from yt_dlp.version import __version__ as yt_dlp_version
 import os
+import re
+import shutil
+import signal
+import threading
+import tempfile
 import time
-import urllib.request
+import httpx
+import orjson
 import uvicorn
 import asyncio
 
@@ -33,7 +44,16 @@ PLATFORMS_CONFIG = {
     }
 }
 COOKIES_REFRESH_INTERVAL = 3600  # 1 hour in seconds
+COOKIES_STARTUP_TIMEOUT = 10  # Max seconds startup waits for the first cookies download
 YTDLP_UPDATE_INTERVAL = 21600  # 6 hours in seconds
+YTDLP_PYPI_URL = 'https://pypi.org/pypi/yt-dlp/json'
+
+# Last ETag / Last-Modified per platform, for conditional cookies downloads
+cookies_validators: dict[str, dict] = {}
+INFO_CACHE_TTL = 60  # Seconds an extracted info dict is reused
+INFO_CACHE_MAX_SIZE = 512
+
+YOUTUBE_ID_RE = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([\w-]{11})(?![\w-])')
 
 
 def detect_platform(url: str) -> str:
@@ -52,19 +72,42 @@ def get_cookies_path(platform: str) -> str | None:
     return config.get('cookies_path')
 
 # Concurrency configuration (optimized for 4 OCPU / 24GB RAM)
-MAX_CONCURRENT_EXTRACTIONS = 60  # Max simultaneous yt-dlp processes
+MAX_CONCURRENT_EXTRACTIONS = 60  # Max simultaneous yt-dlp extractions
 MAX_RETRIES = 3  # Max retry attempts for yt-dlp extraction
 RETRY_DELAY = 4  # Seconds between retries
 EXTRACTION_TIMEOUT = 120  # Timeout per extraction (seconds)
 QUEUE_TIMEOUT = 180  # Max wait time in queue (3 minutes)
+MAX_CONCURRENT_LIMIT = 120  # Upper bound when changing the limit at runtime (PATCH /stats)
+STATS_SNAPSHOT_INTERVAL = 1  # Seconds between /stats snapshot refreshes
+
+# yt-dlp options shared by every extraction (in-process, no CLI fork)
+YDL_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'skip_download': True,
+    'socket_timeout': 30,  # Threads can't be killed: bound network stalls instead
+    'remote_components': ['ejs:github'],  # deno for n-parameter
+    'noplaylist': True,  # watch?v=...&list=... extracts the video only
+}
 
-# Semaphore to limit concurrent extractions
-extraction_semaphore: asyncio.Semaphore = None
+# Admission control: extraction_slots_used < extraction_limit, guarded by
+# extraction_condition (unlike a Semaphore, the limit can change at runtime)
+extraction_condition: asyncio.Condition = None
+extraction_limit: int = MAX_CONCURRENT_EXTRACTIONS
+extraction_slots_used: int = 0
 
-# Lock for thread-safe stats updates
-stats_lock: asyncio.Lock = None
+# Thread pool running yt-dlp (sized for the highest allowed limit, threads are
+# only spawned on demand; the default asyncio pool is capped at cpu_count + 4)
+extraction_executor: ThreadPoolExecutor = None
 
-# Stats for monitoring (protected by stats_lock)
+# Per extraction thread: {cookies_path: (cookies mtime, YoutubeDL)}, reused so
+# building one (~60ms of CPU under the GIL) and the extractor/player caches
+# aren't paid on every extraction
+_thread_ydl = threading.local()
+
+# Stats for monitoring. Only touched from the event loop thread and never
+# across an await, so plain updates are already atomic (no lock needed)
+@dataclass
 class Stats:
     active_extractions: int = 0
     total_extractions: int = 0
@@ -73,39 +116,128 @@ class Stats:
     peak_concurrent: int = 0  # Max simultaneous extractions seen
     total_extraction_time: float = 0.0  # Sum of all extraction times
     waiting_in_queue: int = 0  # Requests waiting for a slot
+    abandoned_extractions: int = 0  # Timed-out yt-dlp threads still running (each holds a slot)
 
 stats = Stats()
 
+# Derived /stats payload, rebuilt every STATS_SNAPSHOT_INTERVAL by stats_snapshot_task
+stats_snapshot: dict = {}
+
+# Extracted info by video id (plain info dicts only, never Tasks/coroutines)
+info_cache: TTLCache = TTLCache(maxsize=INFO_CACHE_MAX_SIZE, ttl=INFO_CACHE_TTL)
+
+# In-flight extractions by video id, so concurrent misses share one yt-dlp run
+info_inflight: dict[str, asyncio.Future] = {}
+
+# In-flight /extract calls by (url, max_video_height), so duplicates share one response
+extract_inflight: dict[tuple, asyncio.Future] = {}
+
+
+async def acquire_extraction_slot():
+    """Wait until an extraction slot is free under the current limit."""
+    global extraction_slots_used
+    async with extraction_condition:
+        try:
+            await extraction_condition.wait_for(lambda: extraction_slots_used < extraction_limit)
+        except asyncio.CancelledError:
+            # Python 3.11 Condition drops a notify() delivered to a waiter that is
+            # cancelled (QUEUE_TIMEOUT) before it resumes: pass the free slot on
+            if extraction_slots_used < extraction_limit:
+                extraction_condition.notify(1)
+            raise
+        extraction_slots_used += 1
+
+
+async def release_extraction_slot():
+    """Free an extraction slot and wake one waiter."""
+    global extraction_slots_used
+    async with extraction_condition:
+        extraction_slots_used -= 1
+        extraction_condition.notify(1)
+
+
+def hold_extraction_slot(future: Future):
+    """Keep a slot busy for an abandoned extraction thread until it really ends
+    (threads can't be killed), so the limit still bounds running yt-dlp threads."""
+    global extraction_slots_used
+    extraction_slots_used += 1
+    stats.abandoned_extractions += 1
+    loop = asyncio.get_running_loop()
+
+    def on_done(_):
+        # Runs in the extraction thread
+        try:
+            loop.call_soon_threadsafe(lambda: start_background_task(release_held_extraction_slot()))
+        except RuntimeError:
+            pass  # Loop already closed (shutdown)
+
+    future.add_done_callback(on_done)
+
+
+async def release_held_extraction_slot():
+    stats.abandoned_extractions -= 1
+    await release_extraction_slot()
+
+
+def refresh_stats_snapshot():
+    """Read all counters at once and store the derived /stats payload."""
+    global stats_snapshot
+    successful = stats.total_extractions - stats.failed_extractions
+    avg_time = stats.total_extraction_time / max(successful, 1)
+    stats_snapshot = {
+        "active_extractions": stats.active_extractions,
+        "waiting_in_queue": stats.waiting_in_queue,
+        "abandoned_extractions": stats.abandoned_extractions,
+        "max_concurrent": extraction_limit,
+        "peak_concurrent": stats.peak_concurrent,
+        "total_extractions": stats.total_extractions,
+        "failed_extractions": stats.failed_extractions,
+        "queue_full_rejections": stats.queue_full_rejections,
+        "success_rate": round(
+            successful / max(stats.total_extractions, 1) * 100, 2
+        ),
+        "avg_extraction_time_seconds": round(avg_time, 2),
+    }
+
+
+async def stats_snapshot_task():
+    """Background task: refresh the /stats snapshot every second."""
+    while True:
+        refresh_stats_snapshot()
+        await asyncio.sleep(STATS_SNAPSHOT_INTERVAL)
+
+
+def parse_version(version: str) -> tuple:
+    """'2025.01.15' / '2025.01.15.232' -> comparable tuple of ints."""
+    return tuple(int(part) for part in re.findall(r'\d+', version))
+
 
 async def update_ytdlp_task():
-    """Background task: update yt-dlp once per day."""
+    """Background task: check for a newer yt-dlp every YTDLP_UPDATE_INTERVAL.
+    yt-dlp is loaded in-process, so the update is never installed under the
+    running interpreter: the server shuts down gracefully, the container
+    restart policy brings it back and the Dockerfile.oci CMD installs the new
+    version before the server starts."""
     while True:
-        # Wait 24h before first update (yt-dlp is fresh from Docker build)
+        # yt-dlp is fresh from the last start, wait before the first check
         await asyncio.sleep(YTDLP_UPDATE_INTERVAL)
 
         try:
-            print("[yt-dlp] Updating via pip...")
-            result = subprocess.run(
-                ['pip', 'install', '--upgrade', 'yt-dlp'],
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
-
-            if result.returncode == 0:
-                # Get new version
-                version_result = subprocess.run(
-                    ['yt-dlp', '--version'],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                print(f"[yt-dlp] Updated to version: {version_result.stdout.strip()}")
-            else:
-                print(f"[yt-dlp] Update failed: {result.stderr[-500:]}")
-
+            response = await app.state.http.get(YTDLP_PYPI_URL)
+            response.raise_for_status()
+            latest = response.json()['info']['version']
         except Exception as e:
-            print(f"[yt-dlp] Update error: {e}")
+            print(f"[yt-dlp] Update check error: {e}")
+            continue
+
+        if parse_version(latest) <= parse_version(yt_dlp_version):
+            print(f"[yt-dlp] Up to date: {yt_dlp_version}")
+            continue
+
+        # Same path as `docker stop`: uvicorn drains in-flight requests, then exits
+        print(f"[yt-dlp] Version {latest} available (running {yt_dlp_version}), restarting to update")
+        os.kill(os.getpid(), signal.SIGTERM)
+        return
 
 
 async def download_cookies_task():
@@ -121,61 +253,150 @@ async def download_cookies_task():
             if not cookies_url or not cookies_path:
                 continue
 
+            tmp_path = None
             try:
-                # Create request without cache
-                req = urllib.request.Request(cookies_url, headers={
+                # Request without intermediate caches, but conditional on
+                # the last validators so an unchanged file returns a 304
+                headers = {
                     'Cache-Control': 'no-cache',
                     'Pragma': 'no-cache',
                     'User-Agent': 'Mozilla/5.0'
-                })
-
-                with urllib.request.urlopen(req, timeout=30) as response:
-                    content = response.read()
-
-                with open(cookies_path, 'wb') as f:
-                    f.write(content)
-
-                size = os.path.getsize(cookies_path)
-                print(f"[Cookies] {platform}: {size} bytes")
+                }
+                validators = cookies_validators.get(platform, {}) if os.path.exists(cookies_path) else {}
+                if validators.get('etag'):
+                    headers['If-None-Match'] = validators['etag']
+                if validators.get('last_modified'):
+                    headers['If-Modified-Since'] = validators['last_modified']
+
+                response = await app.state.http.get(cookies_url, headers=headers)
+
+                if response.status_code == 304:
+                    print(f"[Cookies] {platform}: unchanged (304)")
+                else:
+                    response.raise_for_status()
+                    content = response.content
+
+                    # Atomic replace: extractions never load a half-written file
+                    with tempfile.NamedTemporaryFile(dir=os.path.dirname(cookies_path), delete=False) as f:
+                        tmp_path = f.name
+                        f.write(content)
+                    os.replace(tmp_path, cookies_path)
+                    tmp_path = None
+                    app.state.cookies_ready.add(cookies_path)
+
+                    cookies_validators[platform] = {
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                    }
+                    print(f"[Cookies] {platform}: {len(content)} bytes")
 
             except Exception as e:
                 print(f"[Cookies] {platform} download error: {e}")
+            finally:
+                if tmp_path:
+                    os.unlink(tmp_path)
+
+        # First pass done (startup waits on this before serving)
+        app.state.cookies_ready_event.set()
 
         # Wait 1 hour before next download
         await asyncio.sleep(COOKIES_REFRESH_INTERVAL)
 
 
+def start_background_task(coro) -> asyncio.Task:
+    """create_task() holding a strong reference in app.state.bg_tasks until the task ends."""
+    task = asyncio.create_task(coro, name=coro.__name__)
+    app.state.bg_tasks.add(task)
+    task.add_done_callback(_background_task_done)
+    return task
+
+
+def _background_task_done(task: asyncio.Task):
+    """Drop the reference and report a background task that died (it would otherwise stop silently)."""
+    app.state.bg_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[Background] {task.get_name()} stopped with error: {task.exception()!r}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup/shutdown lifecycle."""
-    global extraction_semaphore, stats_lock
+    global extraction_condition, extraction_executor
 
-    # Initialize semaphore and lock for concurrency control
-    extraction_semaphore = asyncio.Semaphore(MAX_CONCURRENT_EXTRACTIONS)
-    stats_lock = asyncio.Lock()
-    print(f"[Startup] Semaphore initialized: max {MAX_CONCURRENT_EXTRACTIONS} concurrent extractions")
+    # Initialize admission condition for concurrency control
+    extraction_condition = asyncio.Condition()
+    extraction_executor = ThreadPoolExecutor(
+        max_workers=MAX_CONCURRENT_LIMIT,
+        thread_name_prefix='yt-dlp'
+    )
+
+    # Cached for /health (the loaded yt-dlp only changes on restart)
+    app.state.yt_dlp_version = yt_dlp_version
+    app.state.deno_available = shutil.which('deno') is not None
+
+    # Cookies paths available to yt-dlp (checked by get_video_info); a file
+    # kept from a previous run counts until the first refresh replaces it
+    app.state.cookies_ready = {
+        config['cookies_path'] for config in PLATFORMS_CONFIG.values()
+        if config.get('cookies_path') and os.path.exists(config['cookies_path'])
+    }
+
+    # Shared keep-alive HTTP client (cookies + HLS manifests)
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        follow_redirects=True,  # Like urlopen: cookies/HLS URLs may redirect
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+        timeout=30
+    )
+    print(f"[Startup] Admission control initialized: max {extraction_limit} concurrent extractions")
 
     # Startup: launch background tasks
     print("[Startup] Starting background tasks...")
-    cookies_task = asyncio.create_task(download_cookies_task())
-    ytdlp_task = asyncio.create_task(update_ytdlp_task())
+    app.state.bg_tasks = set()
+    app.state.cookies_ready_event = asyncio.Event()
+    start_background_task(download_cookies_task())
+    start_background_task(update_ytdlp_task())
+    start_background_task(stats_snapshot_task())
 
-    # Wait a bit for first cookie download
-    await asyncio.sleep(2)
+    # Don't serve before the first cookie download has been attempted
+    try:
+        await asyncio.wait_for(app.state.cookies_ready_event.wait(), timeout=COOKIES_STARTUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"[Startup] Cookies download still running after {COOKIES_STARTUP_TIMEOUT}s")
+
+    missing = [
+        platform for platform, config in PLATFORMS_CONFIG.items()
+        if config.get('cookies_path') and config['cookies_path'] not in app.state.cookies_ready
+    ]
+    if missing:
+        print(f"[Startup] Starting without cookies for: {', '.join(missing)}")
 
     yield
 
-    # Shutdown: cancel background tasks
-    cookies_task.cancel()
-    ytdlp_task.cancel()
+    # Shutdown: cancel background tasks and wait for them to unwind
+    bg_tasks = list(app.state.bg_tasks)
+    for task in bg_tasks:
+        task.cancel()
+    await asyncio.gather(*bg_tasks, return_exceptions=True)
+    extraction_executor.shutdown(wait=False, cancel_futures=True)
+    await app.state.http.aclose()
     print("[Shutdown] Background tasks stopped")
 
 
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson (C serializer, fast on long fragment lists).
+    Defined here because fastapi.responses.ORJSONResponse is deprecated upstream."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
 app = FastAPI(
     title="YouTube Manifest Extractor",
     description="Extracts HLS fragment URLs for video and audio from YouTube",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 
@@ -213,6 +434,10 @@ class ExtractResponse(BaseModel):
     audio_manifest: ManifestInfo
 
 
+class ConcurrencyUpdate(BaseModel):
+    max_concurrent: int
+
+
 class HealthResponse(BaseModel):
     status: str
     yt_dlp_version: str
@@ -221,55 +446,94 @@ class HealthResponse(BaseModel):
 
 # --- Core Functions ---
 
-async def get_video_info(url: str, cookies_path: str = None) -> dict:
-    """Extract video info with all format details using yt-dlp (async) with retry."""
-    cmd = [
-        'yt-dlp',
-        '--ignore-config',  # Avoid config file conflicts
-        '--dump-json',
-        '--no-download',
-        '--remote-components', 'ejs:github',  # deno for n-parameter
-    ]
+def get_thread_ydl(cookies_path: str = None) -> YoutubeDL:
+    """YoutubeDL owned by the calling extraction thread, rebuilt only when the
+    cookies file changes."""
+    instances = getattr(_thread_ydl, 'instances', None)
+    if instances is None:
+        instances = _thread_ydl.instances = {}
 
-    # Add cookies if available
-    if cookies_path and os.path.exists(cookies_path):
-        cmd.extend(['--cookies', cookies_path])
-        print(f"[yt-dlp] Using cookies: {cookies_path}")
+    try:
+        cookies_mtime = os.path.getmtime(cookies_path) if cookies_path else None
+    except OSError:
+        cookies_path = cookies_mtime = None
+
+    mtime, ydl = instances.get(cookies_path, (None, None))
+    if ydl is None or mtime != cookies_mtime:
+        if ydl is not None:
+            # Don't write the jar back: the shared cookies file is only written by download_cookies_task
+            ydl.params['cookiefile'] = None
+            ydl.close()
+
+        opts = dict(YDL_OPTS)
+        if cookies_path:
+            opts['cookiefile'] = cookies_path
+
+        ydl = YoutubeDL(opts)
+        instances[cookies_path] = (cookies_mtime, ydl)
+
+    return ydl
 
-    cmd.append(url)
+
+def _extract_info_sync(url: str, cookies_path: str = None, on_raw_formats=None) -> dict:
+    """Sync yt-dlp extraction (runs in extraction_executor).
+    on_raw_formats, if given, is called (in this thread) with the raw extractor
+    formats before yt-dlp's format processing starts."""
+    ydl = get_thread_ydl(cookies_path)
+
+    if on_raw_formats is None:
+        return ydl.extract_info(url, download=False)
+
+    # process=True in two steps (no wait_for_video in YDL_OPTS) so the caller
+    # can start work on the raw formats while yt-dlp processes them
+    ie_result = ydl.extract_info(url, download=False, process=False)
+    if ie_result is None:
+        return None
+    try:
+        on_raw_formats(list(ie_result.get('formats') or []))
+    except Exception as e:
+        # Speculative only: never fail the real extraction
+        print(f"[yt-dlp] Raw formats hook error: {e}")
+    return ydl.process_ie_result(ie_result, download=False)
+
+
+async def get_video_info(url: str, cookies_path: str = None, on_raw_formats=None) -> dict:
+    """Extract video info with all format details using yt-dlp (in-process, async) with retry."""
+    # Add cookies if available (flag set by download_cookies_task, no stat per request)
+    if cookies_path and cookies_path in app.state.cookies_ready:
+        print(f"[yt-dlp] Using cookies: {cookies_path}")
+    else:
+        cookies_path = None
 
     last_error = None
 
     for attempt in range(1, MAX_RETRIES + 1):
         print(f"[yt-dlp] Extracting info (attempt {attempt}/{MAX_RETRIES}): {url}")
 
-        # Async subprocess - non-blocking
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-
+        future = extraction_executor.submit(_extract_info_sync, url, cookies_path, on_raw_formats)
         try:
-            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=EXTRACTION_TIMEOUT)
+            info = await asyncio.wait_for(asyncio.wrap_future(future), timeout=EXTRACTION_TIMEOUT)
+        except asyncio.CancelledError:
+            # A still-queued attempt is just cancelled, a running one holds a slot until it ends
+            if not future.done():
+                hold_extraction_slot(future)
+            raise
         except asyncio.TimeoutError:
-            proc.kill()
-            await proc.wait()  # Clean up zombie process
+            # The thread can't be stopped: it holds a slot until it ends and
+            # no retry is started on top of it
+            if not future.done():
+                hold_extraction_slot(future)
             last_error = f"yt-dlp timeout after {EXTRACTION_TIMEOUT}s"
-            print(f"[yt-dlp] Attempt {attempt} failed: {last_error}")
-            if attempt < MAX_RETRIES:
-                await asyncio.sleep(RETRY_DELAY)
-            continue
-
-        if proc.returncode != 0:
-            last_error = f"yt-dlp error: {stderr.decode()[-500:]}"
+            print(f"[yt-dlp] Attempt {attempt} failed: {last_error} (not retried)")
+            break
+        except Exception as e:
+            last_error = f"yt-dlp error: {str(e)[-500:]}"
             print(f"[yt-dlp] Attempt {attempt} failed: {last_error[:100]}...")
             if attempt < MAX_RETRIES:
                 await asyncio.sleep(RETRY_DELAY)
             continue
 
         # Success!
-        info = json.loads(stdout.decode())
         if attempt > 1:
             print(f"[yt-dlp] Succeeded on attempt {attempt}")
         return info
@@ -278,163 +542,209 @@ async def get_video_info(url: str, cookies_path: str = None) -> dict:
     raise Exception(last_error)
 
 
-def get_video_dimension(f: dict) -> int:
-    """Get the smaller dimension (for vertical video support).
-    For horizontal video (1280x720): returns 720
-    For vertical video (576x1024): returns 576"""
-    height = f.get('height') or 0
-    width = f.get('width') or 0
-    if height and width:
-        return min(height, width)
-    return height or width
+def get_info_cache_key(url: str) -> str:
+    """Cache key: video id for YouTube URLs that have one, otherwise the URL itself
+    (a ?v= on another site must not share a YouTube video's entry)."""
+    if detect_platform(url) != 'youtube':
+        return url
+    match = YOUTUBE_ID_RE.search(url)
+    return match.group(1) if match else url
 
 
-def select_best_video_format(formats: list, max_height: int = 720) -> dict:
-    """Select the best video format with dimension <= max_height. Prioritizes VP9 codec.
-    Uses min(width, height) for vertical video support (TikTok, Instagram, etc.).
-    Falls back to combined (video+audio) formats for platforms like TikTok."""
-
-    # First try: video-only formats (YouTube style)
-    video_formats = [
-        f for f in formats
-        if f.get('vcodec') != 'none'
-        and f.get('acodec') == 'none'
-        and get_video_dimension(f) > 0
-        and get_video_dimension(f) <= max_height
-    ]
+async def run_coalesced(inflight: dict, key, factory):
+    """Await factory() at most once per key at a time: concurrent callers with
+    the same key get the first caller's result (or exception) instead."""
+    future = inflight.get(key)
+    if future is not None:
+        # Shield: a cancelled waiter must not cancel the shared work
+        return await asyncio.shield(future)
 
-    # Fallback: combined formats with video (TikTok/Instagram/Facebook style)
-    if not video_formats:
-        video_formats = [
-            f for f in formats
-            if f.get('vcodec') != 'none'
-            and get_video_dimension(f) > 0
-            and get_video_dimension(f) <= max_height
-        ]
-        if video_formats:
-            print("[Video] No video-only formats, using combined format (TikTok/Insta/FB mode)")
-
-    if not video_formats:
-        raise Exception(f"No video format found with dimension <= {max_height}")
-
-    def format_score(f):
-        height = f.get('height', 0)
-        tbr = f.get('tbr', 0) or 0
-        vcodec = f.get('vcodec', '')
-        ext = f.get('ext', '')
-
-        fragments = f.get('fragments', [])
-        has_direct_fragments = len(fragments) > 1 or (
-            len(fragments) == 1 and
-            fragments[0].get('url', '').startswith('https://') and
-            'manifest' not in fragments[0].get('url', '').lower()
-        )
-
-        url = f.get('url', '')
-        is_hls = 'manifest' in url.lower() or url.endswith('.m3u8')
+    future = asyncio.get_running_loop().create_future()
+    inflight[key] = future
+    try:
+        result = await factory()
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # Mark as retrieved: there may be no waiters
+        raise
+    except BaseException:
+        future.cancel()
+        raise
+    finally:
+        inflight.pop(key, None)
 
-        if has_direct_fragments:
-            url_score = 3
-        elif url and not is_hls:
-            url_score = 2
-        else:
-            url_score = 1
+    future.set_result(result)
+    return result
 
-        # Prioritize VP9 codec
-        if 'vp9' in vcodec.lower() or 'vp09' in vcodec.lower():
-            codec_score = 2
-        elif 'avc' in vcodec.lower() or 'h264' in vcodec.lower():
-            codec_score = 1
-        else:
-            codec_score = 0
 
-        if ext == 'webm':
-            ext_score = 2
-        elif ext == 'mp4':
-            ext_score = 1
-        else:
-            ext_score = 0
+async def get_video_info_cached(url: str, cookies_path: str = None, on_raw_formats=None) -> dict:
+    """get_video_info behind a TTL cache; concurrent misses for the same video
+    wait on the first request's extraction instead of starting their own.
+    on_raw_formats is only used when this call runs the extraction itself."""
+    key = get_info_cache_key(url)
 
-        return (url_score, codec_score, ext_score, height, tbr)
+    info = info_cache.get(key)
+    if info is not None:
+        print(f"[Cache] Hit: {key}")
+        return info
 
-    video_formats.sort(key=format_score, reverse=True)
-    return video_formats[0]
+    if key in info_inflight:
+        print(f"[Cache] Joining in-flight extraction: {key}")
 
+    async def extract():
+        info = await get_video_info(url, cookies_path, on_raw_formats)
+        # Keyed by video id: only cache a single video that has formats
+        if info and info.get('_type', 'video') == 'video' and info.get('formats'):
+            info_cache[key] = info
+        return info
 
-def select_best_audio_format(formats: list) -> dict:
-    """Select the best audio-only format. Prioritizes original track and Opus codec.
-    Falls back to combined (video+audio) formats for platforms like TikTok."""
+    return await run_coalesced(info_inflight, key, extract)
 
-    # First try: audio-only formats (YouTube style)
-    audio_formats = [
-        f for f in formats
-        if f.get('vcodec') == 'none'
-        and f.get('acodec') != 'none'
-    ]
 
-    # Fallback: combined formats with audio (TikTok style)
-    if not audio_formats:
-        audio_formats = [
-            f for f in formats
-            if f.get('acodec') is not None
-            and f.get('acodec') != 'none'
-        ]
-        if audio_formats:
-            print("[Audio] No audio-only formats, using combined format (TikTok mode)")
-
-    if not audio_formats:
-        raise Exception("No audio format found")
+def get_video_dimension(f: dict) -> int:
+    """Get the smaller dimension (for vertical video support).
+    For horizontal video (1280x720): returns 720
+    For vertical video (576x1024): returns 576"""
+    height = f.get('height') or 0
+    width = f.get('width') or 0
+    if height and width:
+        return min(height, width)
+    return height or width
 
-    def audio_score(f):
-        # Prioritize original audio track (higher language_preference = original)
-        lang_pref = f.get('language_preference', 0) or 0
 
-        acodec = f.get('acodec', '')
-        # Prioritize Opus codec
-        if 'opus' in acodec.lower():
-            codec_score = 2
-        elif 'aac' in acodec.lower() or 'mp4a' in acodec.lower():
-            codec_score = 1
+def _video_format_score(f: dict) -> tuple:
+    """Video score: direct fragments > direct URL > HLS, then VP9 > H.264, webm > mp4, height, bitrate."""
+    height = f.get('height', 0)
+    tbr = f.get('tbr', 0) or 0
+    vcodec = (f.get('vcodec') or '').lower()
+    ext = f.get('ext', '')
+
+    fragments = f.get('fragments', [])
+    if len(fragments) == 1:
+        fragment_url = fragments[0].get('url', '')
+        has_direct_fragments = fragment_url.startswith('https://') and 'manifest' not in fragment_url
+    else:
+        has_direct_fragments = len(fragments) > 1
+
+    url = f.get('url', '')
+    # Case-sensitive: the manifest/.m3u8 path tokens are lowercase in extractor URLs
+    is_hls = 'manifest' in url or url.endswith('.m3u8')
+
+    if has_direct_fragments:
+        url_score = 3
+    elif url and not is_hls:
+        url_score = 2
+    else:
+        url_score = 1
+
+    # Prioritize VP9 codec
+    if 'vp9' in vcodec or 'vp09' in vcodec:
+        codec_score = 2
+    elif 'avc' in vcodec or 'h264' in vcodec:
+        codec_score = 1
+    else:
+        codec_score = 0
+
+    if ext == 'webm':
+        ext_score = 2
+    elif ext == 'mp4':
+        ext_score = 1
+    else:
+        ext_score = 0
+
+    return (url_score, codec_score, ext_score, height, tbr)
+
+
+def _audio_format_score(f: dict) -> tuple:
+    """Audio score: original track first (language_preference), then Opus > AAC, bitrate."""
+    # Prioritize original audio track (higher language_preference = original)
+    lang_pref = f.get('language_preference', 0) or 0
+
+    acodec = (f.get('acodec') or '').lower()
+    # Prioritize Opus codec
+    if 'opus' in acodec:
+        codec_score = 2
+    elif 'aac' in acodec or 'mp4a' in acodec:
+        codec_score = 1
+    else:
+        codec_score = 0
+
+    abr = f.get('abr', 0) or 0
+    return (lang_pref, codec_score, abr)
+
+
+def select_best_formats(formats: list, max_height: int = 720, log: bool = True) -> tuple:
+    """Select the best video and audio formats in a single pass over formats.
+    Video: dimension <= max_height (min(width, height) for vertical video), VP9 first.
+    Audio: original track and Opus first.
+    Separate video-only/audio-only streams (YouTube style) always win over
+    combined video+audio formats, which are only a fallback (TikTok/Instagram/Facebook).
+    Returns (video_format, audio_format)."""
+    best_video, best_video_key = None, None
+    best_audio, best_audio_key = None, None
+
+    for f in formats:
+        vcodec = f.get('vcodec')
+        acodec = f.get('acodec')
+
+        if vcodec != 'none':
+            dimension = get_video_dimension(f)
+            if 0 < dimension <= max_height:
+                # Leading flag: video-only beats combined
+                key = (acodec == 'none', *_video_format_score(f))
+                if best_video_key is None or key > best_video_key:
+                    best_video, best_video_key = f, key
+
+        if vcodec == 'none' and acodec != 'none':
+            audio_only = True
+        elif acodec is not None and acodec != 'none':
+            audio_only = False
         else:
-            codec_score = 0
-
-        abr = f.get('abr', 0) or 0
-        return (lang_pref, codec_score, abr)
-
-    audio_formats.sort(key=audio_score, reverse=True)
-    selected = audio_formats[0]
-    print(f"[Audio] Selected: lang_pref={selected.get('language_preference')}, codec={selected.get('acodec')}, lang={selected.get('language')}")
-    return selected
+            continue
 
+        # Leading flag: audio-only beats combined
+        key = (audio_only, *_audio_format_score(f))
+        if best_audio_key is None or key > best_audio_key:
+            best_audio, best_audio_key = f, key
 
-def _fetch_hls_segments_sync(manifest_url: str) -> list:
-    """Sync helper for fetching HLS manifest (runs in thread pool)."""
-    req = urllib.request.Request(manifest_url, headers={
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-    })
-    with urllib.request.urlopen(req, timeout=30) as response:
-        content = response.read().decode('utf-8')
-
-    segments = []
-    base_url = manifest_url.rsplit('/', 1)[0] + '/'
+    if best_video is None:
+        raise Exception(f"No video format found with dimension <= {max_height}")
+    if not best_video_key[0] and log:
+        print("[Video] No video-only formats, using combined format (TikTok/Insta/FB mode)")
 
-    for line in content.split('\n'):
-        line = line.strip()
-        if line and not line.startswith('#'):
-            if line.startswith('http'):
-                segments.append(line)
-            else:
-                segments.append(base_url + line)
+    if best_audio is None:
+        raise Exception("No audio format found")
+    if not best_audio_key[0] and log:
+        print("[Audio] No audio-only formats, using combined format (TikTok mode)")
 
-    return segments
+    if log:
+        print(f"[Audio] Selected: lang_pref={best_audio.get('language_preference')}, codec={best_audio.get('acodec')}, lang={best_audio.get('language')}")
+    return best_video, best_audio
 
 
 async def fetch_hls_segments(manifest_url: str) -> list:
-    """Fetch HLS manifest and extract segment URLs (async, non-blocking)."""
+    """Fetch HLS manifest and extract segment URLs (async, pooled connection)."""
     print(f"[HLS] Fetching manifest: {manifest_url[:80]}...")
 
     try:
-        segments = await asyncio.to_thread(_fetch_hls_segments_sync, manifest_url)
+        response = await app.state.http.get(manifest_url, headers={
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        })
+        response.raise_for_status()
+
+        # Parse as bytes: comment lines are never decoded, CRLF handled by splitlines()
+        segments = []
+        # Relative segments resolve against the final URL (after redirects)
+        base_url = str(response.url).rsplit('/', 1)[0].encode() + b'/'
+
+        for line in response.content.splitlines():
+            line = line.strip()
+            if line and not line.startswith(b'#'):
+                if line.startswith(b'http'):
+                    segments.append(line.decode())
+                else:
+                    segments.append((base_url + line).decode())
+
         print(f"[HLS] Found {len(segments)} segments")
         return segments
 
@@ -443,35 +753,84 @@ async def fetch_hls_segments(manifest_url: str) -> list:
         return []
 
 
-async def extract_fragment_urls(format_info: dict, fetch_hls: bool = True) -> list:
-    """Extract fragment URLs from a format (async)."""
+def get_hls_manifest_url(format_info: dict) -> Optional[str]:
+    """URL extract_fragment_urls fetches as an HLS manifest for this format, if any."""
     fragments = format_info.get('fragments', [])
 
     if fragments:
-        urls = []
-        for f in fragments:
-            url = f.get('url') or f.get('path')
-            if url:
-                urls.append(url)
-
-        if len(urls) == 1 and fetch_hls:
-            url = urls[0]
-            if 'manifest' in url.lower() or '.m3u8' in url.lower():
-                hls_segments = await fetch_hls_segments(url)
-                if hls_segments:
-                    return hls_segments
+        urls = [u for u in (f.get('url') or f.get('path') for f in fragments) if u]
+        url = urls[0] if len(urls) == 1 else None
+    else:
+        url = format_info.get('url')
+
+    # Case-sensitive, like _video_format_score (no per-check lowercase copy of the URL)
+    if url and ('manifest' in url or '.m3u8' in url):
+        return url
+    return None
+
+
+class HlsPrefetch:
+    """Speculative HLS manifest fetches for one /extract request.
+    Started from yt-dlp's raw formats while it still processes them; a fetch
+    is reused if the final selection picks the same manifest, cancelled otherwise."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_height: int):
+        self.loop = loop
+        self.max_height = max_height
+        self.tasks = {}
+        self.closed = False
+
+    def on_raw_formats(self, formats: list):
+        """Extraction thread: guess the selected formats, start their fetches on the loop.
+        Never raises: a wrong guess (or a closed loop at shutdown) only costs the prefetch."""
+        try:
+            picks = select_best_formats(formats, self.max_height, log=False)
+            urls = [url for url in map(get_hls_manifest_url, picks) if url]
+            if urls:
+                self.loop.call_soon_threadsafe(self._start, urls)
+        except Exception:
+            return
+
+    def _start(self, urls: list):
+        if self.closed:
+            return
+        for url in urls:
+            if url not in self.tasks:
+                print(f"[HLS] Prefetching manifest: {url[:80]}...")
+                self.tasks[url] = asyncio.create_task(fetch_hls_segments(url))
+
+    def take(self, url: str) -> Optional[asyncio.Task]:
+        return self.tasks.pop(url, None)
+
+    def close(self):
+        """Cancel speculative fetches that were not used."""
+        self.closed = True
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+
+
+async def extract_fragment_urls(format_info: dict, fetch_hls: bool = True,
+                                prefetch: Optional[HlsPrefetch] = None) -> list:
+    """Extract fragment URLs from a format (async).
+    Reuses a matching speculative manifest fetch from prefetch when there is one."""
+    manifest_url = get_hls_manifest_url(format_info) if fetch_hls else None
+    if manifest_url:
+        task = prefetch.take(manifest_url) if prefetch else None
+        if task:
+            print(f"[HLS] Using prefetched manifest: {manifest_url[:80]}...")
+            hls_segments = await task
+        else:
+            hls_segments = await fetch_hls_segments(manifest_url)
+        if hls_segments:
+            return hls_segments
 
-        return urls
+    fragments = format_info.get('fragments', [])
+    if fragments:
+        return [u for u in (f.get('url') or f.get('path') for f in fragments) if u]
 
     url = format_info.get('url')
-    if url:
-        if fetch_hls and ('manifest' in url.lower() or '.m3u8' in url.lower()):
-            hls_segments = await fetch_hls_segments(url)
-            if hls_segments:
-                return hls_segments
-        return [url]
-
-    return []
+    return [url] if url else []
 
 
 def create_manifest(format_info: dict, fragments: list) -> dict:
@@ -494,6 +853,28 @@ def create_manifest(format_info: dict, fragments: list) -> dict:
     }
 
 
+def build_extract_response(title: str, duration: int, thumbnail: Optional[str], platform: str,
+                           audio_separated: bool, video_format: dict, video_fragments: list,
+                           audio_format: dict, audio_fragments: list) -> ORJSONResponse:
+    """Build the /extract response (sync, CPU-bound: runs in a worker thread)."""
+    video_manifest = create_manifest(video_format, video_fragments)
+    audio_manifest = create_manifest(audio_format, audio_fragments)
+
+    # Plain dicts in ExtractResponse's field order, serialized by orjson in C:
+    # no Pydantic model tree, validation or dump walking every fragment URL.
+    # Returning the Response directly keeps FastAPI from re-validating it;
+    # response_model stays on the route for the OpenAPI schema.
+    return ORJSONResponse(content={
+        'title': title,
+        'duration': duration,
+        'thumbnail': thumbnail,
+        'platform': platform,
+        'audio_separated': audio_separated,
+        'video_manifest': video_manifest,
+        'audio_manifest': audio_manifest,
+    })
+
+
 # --- API Endpoints ---
 
 @app.post("/orchestrateur-gpu")
@@ -508,45 +889,38 @@ async def orchestrateur_gpu(request: dict):
 
 @app.get("/stats")
 async def get_stats():
-    """Server statistics for monitoring."""
-    successful = stats.total_extractions - stats.failed_extractions
-    avg_time = stats.total_extraction_time / max(successful, 1)
-    return {
-        "active_extractions": stats.active_extractions,
-        "waiting_in_queue": stats.waiting_in_queue,
-        "max_concurrent": MAX_CONCURRENT_EXTRACTIONS,
-        "peak_concurrent": stats.peak_concurrent,
-        "total_extractions": stats.total_extractions,
-        "failed_extractions": stats.failed_extractions,
-        "queue_full_rejections": stats.queue_full_rejections,
-        "success_rate": round(
-            successful / max(stats.total_extractions, 1) * 100, 2
-        ),
-        "avg_extraction_time_seconds": round(avg_time, 2),
-    }
+    """Server statistics for monitoring (snapshot, at most STATS_SNAPSHOT_INTERVAL old)."""
+    return stats_snapshot
 
 
-@app.get("/health", response_model=HealthResponse)
-async def health_check():
-    """Health check endpoint."""
-    # Check yt-dlp
-    try:
-        result = subprocess.run(['yt-dlp', '--version'], capture_output=True, text=True, timeout=5)
-        yt_dlp_version = result.stdout.strip() if result.returncode == 0 else "error"
-    except Exception:
-        yt_dlp_version = "not found"
+@app.patch("/stats")
+async def update_concurrency_limit(update: ConcurrencyUpdate):
+    """Change the max concurrent extractions at runtime (backpressure without restart)."""
+    global extraction_limit
 
-    # Check deno
-    try:
-        result = subprocess.run(['which', 'deno'], capture_output=True, text=True, timeout=5)
-        deno_available = result.returncode == 0
-    except Exception:
-        deno_available = False
+    if not 1 <= update.max_concurrent <= MAX_CONCURRENT_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"max_concurrent must be between 1 and {MAX_CONCURRENT_LIMIT}"
+        )
+
+    async with extraction_condition:
+        extraction_limit = update.max_concurrent
+        # Waiters re-check the predicate against the new limit
+        extraction_condition.notify_all()
 
+    refresh_stats_snapshot()
+    print(f"[API] Max concurrent extractions set to {extraction_limit}")
+    return {"max_concurrent": extraction_limit}
+
+
+@app.get("/health", response_model=HealthResponse)
+async def health_check():
+    """Health check endpoint (values cached at startup, no subprocess)."""
     return HealthResponse(
         status="ok",
-        yt_dlp_version=yt_dlp_version,
-        deno_available=deno_available
+        yt_dlp_version=app.state.yt_dlp_version,
+        deno_available=app.state.deno_available
     )
 
 
@@ -556,22 +930,32 @@ async def extract_manifests(request: ExtractRequest):
     Extract video and audio manifests from YouTube URL.
 
     Returns fragment URLs for downloading video (<=720p) and audio separately.
-    Concurrency is limited to MAX_CONCURRENT_EXTRACTIONS simultaneous requests.
+    Concurrency is limited to extraction_limit simultaneous requests
+    (MAX_CONCURRENT_EXTRACTIONS by default, adjustable via PATCH /stats).
+    Identical concurrent requests (same url and max_video_height) share one
+    extraction and don't take a slot of their own.
     """
+    key = (request.url, request.max_video_height)
+    if key in extract_inflight:
+        print(f"[API] Joining in-flight request: {request.url}")
+
+    return await run_coalesced(extract_inflight, key, lambda: _extract_manifests(request))
+
+
+async def _extract_manifests(request: ExtractRequest):
+    """/extract body: admission control, extraction and response building."""
     # Track queue waiting
-    async with stats_lock:
-        stats.waiting_in_queue += 1
+    stats.waiting_in_queue += 1
 
-    # Try to acquire semaphore with timeout (don't wait forever)
+    # Try to acquire a slot with timeout (don't wait forever)
     try:
         await asyncio.wait_for(
-            extraction_semaphore.acquire(),
+            acquire_extraction_slot(),
             timeout=QUEUE_TIMEOUT
         )
     except asyncio.TimeoutError:
-        async with stats_lock:
-            stats.waiting_in_queue -= 1
-            stats.queue_full_rejections += 1
+        stats.waiting_in_queue -= 1
+        stats.queue_full_rejections += 1
         print(f"[API] Server overloaded - rejected request (active: {stats.active_extractions})")
         raise HTTPException(
             status_code=503,
@@ -580,15 +964,14 @@ async def extract_manifests(request: ExtractRequest):
 
     # Track stats - got a slot
     start_time = time.time()
-    async with stats_lock:
-        stats.waiting_in_queue -= 1
-        stats.active_extractions += 1
-        stats.total_extractions += 1
-        if stats.active_extractions > stats.peak_concurrent:
-            stats.peak_concurrent = stats.active_extractions
+    stats.waiting_in_queue -= 1
+    stats.active_extractions += 1
+    stats.total_extractions += 1
+    stats.peak_concurrent = max(stats.peak_concurrent, stats.active_extractions)
+    hls_prefetch = HlsPrefetch(asyncio.get_running_loop(), request.max_video_height)
 
     try:
-        print(f"[API] Processing URL: {request.url} (active: {stats.active_extractions}/{MAX_CONCURRENT_EXTRACTIONS})")
+        print(f"[API] Processing URL: {request.url} (active: {stats.active_extractions}/{extraction_limit})")
         print(f"[API] Max video height: {request.max_video_height}")
 
         # Auto-detect platform and get cookies path (only YouTube needs cookies)
@@ -596,7 +979,8 @@ async def extract_manifests(request: ExtractRequest):
         cookies_path = get_cookies_path(platform)
         print(f"[API] Platform detected: {platform}")
 
-        info = await get_video_info(request.url, cookies_path)
+        # Overlap likely HLS manifest fetches with yt-dlp's format processing
+        info = await get_video_info_cached(request.url, cookies_path, hls_prefetch.on_raw_formats)
 
         title = info.get('title', 'Unknown')
         duration = int(info.get('duration', 0) or 0)  # Convert to int (Facebook returns float)
@@ -606,9 +990,10 @@ async def extract_manifests(request: ExtractRequest):
         print(f"[API] Duration: {duration}s")
         print(f"[API] Formats available: {len(formats)}")
 
-        # Select best formats
-        video_format = select_best_video_format(formats, request.max_video_height)
-        audio_format = select_best_audio_format(formats)
+        # Select best formats (single pass, off the event loop)
+        video_format, audio_format = await asyncio.to_thread(
+            select_best_formats, formats, request.max_video_height
+        )
 
         # Check if audio is separated (audio-only format) or combined with video
         # YouTube/Instagram/Facebook have separate audio tracks, TikTok has combined
@@ -619,44 +1004,37 @@ async def extract_manifests(request: ExtractRequest):
 
         # Extract fragment URLs (run in parallel)
         video_fragments, audio_fragments = await asyncio.gather(
-            extract_fragment_urls(video_format),
-            extract_fragment_urls(audio_format)
+            extract_fragment_urls(video_format, prefetch=hls_prefetch),
+            extract_fragment_urls(audio_format, prefetch=hls_prefetch)
         )
 
         print(f"[API] Video fragments: {len(video_fragments)}")
         print(f"[API] Audio fragments: {len(audio_fragments)}")
 
-        # Create manifests
-        video_manifest = create_manifest(video_format, video_fragments)
-        audio_manifest = create_manifest(audio_format, audio_fragments)
-
-        return ExtractResponse(
-            title=title,
-            duration=duration,
-            thumbnail=info.get('thumbnail'),
-            platform=platform,
-            audio_separated=audio_separated,
-            video_manifest=ManifestInfo(**video_manifest),
-            audio_manifest=ManifestInfo(**audio_manifest),
+        # Build manifests + serialize off the event loop (O(fragments))
+        return await asyncio.to_thread(
+            build_extract_response,
+            title, duration, info.get('thumbnail'), platform, audio_separated,
+            video_format, video_fragments, audio_format, audio_fragments
         )
 
     except HTTPException:
         raise
     except Exception as e:
-        async with stats_lock:
-            stats.failed_extractions += 1
+        stats.failed_extractions += 1
         print(f"[API] Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        # Always release semaphore and update stats
+        # Always release the slot and update stats
+        hls_prefetch.close()
         extraction_time = time.time() - start_time
-        async with stats_lock:
-            stats.active_extractions -= 1
-            stats.total_extraction_time += extraction_time
-        extraction_semaphore.release()
+        stats.active_extractions -= 1
+        stats.total_extraction_time += extraction_time
+        await release_extraction_slot()
 
 
 # --- Main ---
 
 if __name__ == '__main__':
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    # uvloop + httptools ship with uvicorn[standard]; pin them instead of relying on auto-detection
+    uvicorn.run(app, host="0.0.0.0", port=8080, loop="uvloop", http="httptools")